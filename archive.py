@@ -29,8 +29,8 @@ The actual work is done in two main libraries:
 
 import sys
 
-if sys.version_info < (3, 6):
-    version_error = " Python version must be 3.6 or higher\n\
+if sys.version_info < (3, 10):
+    version_error = " Python version must be 3.10 or higher\n\
             Your current version of python is {}.{}\n\
             Please try again with python3.".format(
         sys.version_info.major, sys.version_info.minor
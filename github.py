@@ -10,7 +10,6 @@ content, even if you are using Github to serve the content, and expect
 to convert this tool to a supported option based on that model.
 """
 
-from datetime import datetime
 import time, argparse, subprocess
 
 parser = argparse.ArgumentParser(description="Push/pull repo.")
@@ -33,9 +32,7 @@ def github_push():
                 "commit",
                 "-m",
                 "auto update: {}".format(
-                    datetime.utcfromtimestamp(time.time()).strftime(
-                        "%b %d %Y at %H:%M UTC"
-                    )
+                    time.strftime("%b %d %Y at %H:%M UTC", time.gmtime())
                 ),
             ]
         )
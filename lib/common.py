@@ -1,16 +1,28 @@
-import os
-
-
 def exit_immediately(s):
     print("\nERROR\n", s)
     exit(1)
 
 
+# Directories open_outfile has already made sure exist.
+_created_dirs = set()
+
+
+# Topic files can run to several megabytes, so when writing we buffer
+# far more than the default 8KB to cut down on write() calls.
+WRITE_BUFFER_SIZE = 1 << 20
+
+
 # Safely open dir/filename, creating dir if it doesn't exist
-def open_outfile(dir, filename, mode):
-    if not dir.exists():
-        os.makedirs(str(dir))
-    return (dir / filename).open(mode, encoding="utf-8")
+def open_outfile(dir, filename, mode, buffering=None):
+    if dir not in _created_dirs:
+        dir.mkdir(parents=True, exist_ok=True)
+        _created_dirs.add(dir)
+    if buffering is None:
+        writing = any(c in mode for c in "wax+")
+        buffering = WRITE_BUFFER_SIZE if writing else -1
+    if "b" in mode:
+        return (dir / filename).open(mode, buffering=buffering)
+    return (dir / filename).open(mode, encoding="utf-8", buffering=buffering)
 
 
 def stream_validator(settings):
@@ -21,25 +33,27 @@ def stream_validator(settings):
         exit_immediately('Please add "*" to included_streams.')
 
     if hasattr(settings, "excluded_streams"):
-        excluded_streams = set(settings.excluded_streams)
+        excluded_streams = frozenset(settings.excluded_streams)
     else:
-        excluded_streams = set()
+        excluded_streams = frozenset()
+
+    included_streams = frozenset(settings.included_streams)
 
-    included_streams = set(settings.included_streams)
+    # The wildcards don't change between calls, so check for them once here.
+    include_web_public = "web-public:*" in included_streams
+    # The bare * case is for backwards-compatibility.
+    include_public = "*" in included_streams or "public:*" in included_streams
 
     def validator(stream):
         stream_name = stream["name"]
-        is_web_public = stream["is_web_public"]
-        is_public = not stream["invite_only"]
 
         if stream_name in excluded_streams:
             return False
 
-        if "web-public:*" in included_streams and is_web_public:
+        if include_web_public and stream["is_web_public"]:
             return True
 
-        # The bare * case is for backwards-compatibility.
-        if ("*" in included_streams or "public:*" in included_streams) and is_public:
+        if include_public and not stream["invite_only"]:
             return True
 
         return stream_name in included_streams
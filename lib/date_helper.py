@@ -1,8 +1,13 @@
-from datetime import datetime
+import time
+from functools import lru_cache
 
 
 # I don't love this format, feel free to change (I just
 # extracted it from prior code).
+#
+# Messages sent within the same second share a timestamp, and every
+# topic page formats the same "last updated" time, so we cache.
+@lru_cache(maxsize=8192)
 def format_date1(ts):
     """Nov 05 2019 at 02:51"""
-    return datetime.utcfromtimestamp(ts).strftime("%b %d %Y at %H:%M")
+    return time.strftime("%b %d %Y at %H:%M", time.gmtime(ts))
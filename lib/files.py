@@ -10,14 +10,14 @@ Here is an example structure for the JSON piece:
 
     <json_root>
         stream_index.json
-        213222general
-            47413hello.json
-            48863swimmingturtles.json
-            51687topicdemonstration.json
-            74282newstreams.json
-        213224python
-            47413hello.json
-            95106streamevents.json
+        213222-general
+            hello.json
+            swimming.20turtles.json
+            topic.20demonstration.json
+            new.20streams.json
+        213224-python
+            hello.json
+            stream.20events.json
 
 And then here is what your website output might
 look like:
@@ -26,16 +26,18 @@ look like:
         index.html
         style.css
         stream
-            213222general
+            213222-general
                 index.html
-                47413hello.html
-                48863swimmingturtles.html
-                51687topicdemonstration.html
-                74282newstreams.html
-            213224python
+                topic
+                    hello.html
+                    swimming.20turtles.html
+                    topic.20demonstration.html
+                    new.20streams.html
+            213224-python
                 index.html
-                47413hello.html
-                95106streamevents.html
+                topic
+                    hello.html
+                    stream.20events.html
 
 In the examples above we have two streams:
 
@@ -50,17 +52,23 @@ In the examples above we have two streams:
         stream events
 
 We "sanitize" the directory names to avoid escaping issues
-with spaces (hence the number prefix).  FWIW the number prefix
-for streams corresponds to the Zulip stream id, whereas the topic
-prefix is a random hash.  All that really matters is that they are
-unique.
+with spaces and other special characters, using the same
+encoding Zulip uses in its own URLs (see `sanitize` in url.py).
+The number prefix for streams corresponds to the Zulip stream id.
+Topic names are encoded without a hash prefix; the encoding is
+reversible, so two different topics never share a file name.
 """
 
-import json
+from typing import List
 
-from pathlib import Path
+import msgspec
+import orjson
 
 from .common import open_outfile
+from .zulip_data import Message
+
+_message_decoder = msgspec.json.Decoder(Message)
+_message_list_decoder = msgspec.json.Decoder(List[Message])
 
 
 def read_zulip_stream_info(json_root):
@@ -72,9 +80,7 @@ def read_zulip_stream_info(json_root):
     the stream.  To get actual messages within a topic, you go
     to other files deeper in the directory structure.
     """
-    f = (json_root / Path("stream_index.json")).open("r", encoding="utf-8")
-    stream_info = json.load(f)
-    f.close()
+    stream_info = orjson.loads((json_root / "stream_index.json").read_bytes())
     return stream_info
 
 
@@ -84,29 +90,50 @@ def read_zulip_messages_for_topic(
     """
     <stream>/<topic>.json
 
-    This JSON has info for all the messags in a topic.
+    This JSON has info for all the messags in a topic,
+    one message per line.  We decode straight into Message
+    structs, since that's all the website needs.
     """
-    json_path = (
-        json_root / Path(sanitized_stream_name) / Path(sanitized_topic_name + ".json")
+    json_path = json_root / sanitized_stream_name / (sanitized_topic_name + ".json")
+    return decode_topic_file(
+        json_path.read_bytes(),
+        _message_decoder.decode,
+        _message_list_decoder.decode,
     )
-    f = json_path.open("r", encoding="utf-8")
-    messages = json.load(f)
-    f.close()
-    return messages
+
+
+def parse_topic_messages(data):
+    """
+    Like read_zulip_messages_for_topic, but takes the file's
+    bytes and returns plain message dicts.
+    """
+    return decode_topic_file(data, orjson.loads, orjson.loads)
+
+
+def decode_topic_file(data, decode_message, decode_message_list):
+    """
+    Topic files are newline-delimited JSON, but archives built
+    by older versions have a single JSON list instead, so we
+    accept both.  decode_message decodes one line of the new
+    format, and decode_message_list decodes a whole old one.
+    """
+    if data.startswith(b"["):
+        return decode_message_list(data)
+    return [decode_message(line) for line in data.splitlines() if line]
 
 
 def open_main_page(md_root):
-    outfile = open_outfile(md_root, Path("index.html"), "w+")
+    outfile = open_outfile(md_root, "index.html", "w+")
     return outfile
 
 
 def open_stream_topics_page(md_root, sanitized_stream_name):
-    directory = md_root / Path("stream/" + sanitized_stream_name)
-    outfile = open_outfile(directory, Path("index.html"), "w+")
+    directory = md_root / "stream" / sanitized_stream_name
+    outfile = open_outfile(directory, "index.html", "w+")
     return outfile
 
 
 def open_topic_messages_page(md_root, sanitized_stream_name, sanitized_topic_name):
-    directory = md_root / Path("stream/" + sanitized_stream_name + "/topic")
-    outfile = open_outfile(directory, Path(sanitized_topic_name + ".html"), "w+")
+    directory = md_root / "stream" / sanitized_stream_name / "topic"
+    outfile = open_outfile(directory, sanitized_topic_name + ".html", "w+")
     return outfile
@@ -13,6 +13,8 @@ add helpers/converters as necessary.)
 
 import html
 
+import msgspec
+
 from .date_helper import format_date1
 
 from .url import (
@@ -28,6 +30,7 @@ from .url import (
 )
 
 from .zulip_data import (
+    Message,
     num_topics_string,
     sorted_streams,
     sorted_topics,
@@ -68,8 +71,23 @@ def format_message_html(
     stream_id,
     topic_name,
     msg,
+    sanitized_stream_name=None,
+    sanitized_topic_name=None,
 ):
-    msg_id = str(msg["id"])
+    """
+    msg is a zulip_data.Message or a Zulip message dict.
+    """
+    if isinstance(msg, dict):
+        msg = msgspec.convert(msg, Message)
+
+    # Callers rendering a whole topic should pass in the sanitized names,
+    # so we don't redo that work for every message.
+    if sanitized_stream_name is None:
+        sanitized_stream_name = sanitize_stream(stream_name, stream_id)
+    if sanitized_topic_name is None:
+        sanitized_topic_name = sanitize(topic_name)
+
+    msg_id = str(msg.id)
 
     zulip_link_html = link_to_zulip_html(
         zulip_url,
@@ -80,14 +98,14 @@ def format_message_html(
         msg_id,
     )
 
-    user_name = msg["sender_full_name"]
-    date = format_date1(msg["timestamp"])
-    msg_content_html = msg["content"]
+    user_name = msg.sender_full_name
+    date = format_date1(msg.timestamp)
+    msg_content_html = msg.content
     anchor_url = archive_message_url(
         site_url,
         html_root,
-        sanitize_stream(stream_name, stream_id),
-        sanitize(topic_name),
+        sanitized_stream_name,
+        sanitized_topic_name,
         msg_id,
     )
     anchor_html = '<a name="{0}"></a>'.format(html.escape(msg_id))
@@ -126,18 +144,26 @@ def last_updated_footer_html(stream_info):
     return date_footer_html
 
 
-def stream_list_page_html(streams):
-    content_html = f"""\
+# The write_*_list_html functions write list items to outfile one at a
+# time, so we never hold the whole list in memory.
+
+_STREAM_ITEM_HTML = '<li> <a href="{url}">{stream_name}</a> ({num_topics}) </li>'
+
+_TOPIC_ITEM_HTML = '<li> <a href="topic/{sanitized_topic_name}.html">{topic_name}</a> ({topic_info}) </li>'
+
+
+def write_stream_list_page_html(outfile, streams):
+    outfile.write("""\
 <hr>
 
 <h2>Streams:</h2>
 
-{stream_list_html(streams)}
-"""
-    return content_html
+""")
+    write_stream_list_html(outfile, streams)
+    outfile.write("\n")
 
 
-def stream_list_html(streams):
+def write_stream_list_html(outfile, streams):
     """
     produce a list like this:
 
@@ -145,35 +171,38 @@ def stream_list_html(streams):
     * stream_name (n topics)
     * stream_name (n topics)
     """
-
-    def item_html(stream_name, stream_data):
-        stream_id = stream_data["id"]
-        sanitized_name = sanitize_stream(stream_name, stream_id)
-        url = f"stream/{sanitized_name}/index.html"
-        stream_topic_data = stream_data["topic_data"]
-        num_topics = num_topics_string(stream_topic_data)
-        return f'<li> <a href="{html.escape(url)}">{html.escape(stream_name)}</a> ({html.escape(str(num_topics))}) </li>'
-
-    the_list = "\n\n".join(
-        item_html(stream_name, streams[stream_name])
-        for stream_name in sorted_streams(streams)
-    )
-    return "<ul>\n" + the_list + "\n</ul>"
-
-
-def topic_list_page_html(stream_name, stream_url, topic_data):
-    content = f"""\
+    outfile.write("<ul>\n")
+    for i, stream_name in enumerate(sorted_streams(streams)):
+        stream_data = streams[stream_name]
+        sanitized_name = sanitize_stream(stream_name, stream_data["id"])
+        num_topics = num_topics_string(stream_data["topic_data"])
+        if i > 0:
+            outfile.write("\n\n")
+        outfile.write(
+            _STREAM_ITEM_HTML.format_map(
+                dict(
+                    url=html.escape(f"stream/{sanitized_name}/index.html"),
+                    stream_name=html.escape(stream_name),
+                    num_topics=html.escape(num_topics),
+                )
+            )
+        )
+    outfile.write("\n</ul>")
+
+
+def write_topic_list_page_html(outfile, stream_name, stream_url, topic_data):
+    outfile.write(f"""\
 <h2> Stream: <a href="{html.escape(stream_url)}">{html.escape(stream_name)}</a></h2>
 <hr>
 
 <h3>Topics:</h3>
 
-{topic_list_html(topic_data)}
-"""
-    return content
+""")
+    write_topic_list_html(outfile, topic_data)
+    outfile.write("\n")
 
 
-def topic_list_html(topic_data):
+def write_topic_list_html(outfile, topic_data):
     """
     produce a list like this:
 
@@ -181,14 +210,18 @@ def topic_list_html(topic_data):
     * topic name (n messages, latest: <date>)
     * topic name (n messages, latest: <date>)
     """
-
-    def item_html(topic_name, message_data):
-        link_html = f'<a href="topic/{html.escape(sanitize(topic_name))}.html">{html.escape(topic_name)}</a>'
-        topic_info = topic_info_string(message_data)
-        return f"<li> {link_html} ({html.escape(topic_info)}) </li>"
-
-    the_list_html = "\n".join(
-        item_html(topic_name, topic_data[topic_name])
-        for topic_name in sorted_topics(topic_data)
-    )
-    return "<ul>\n" + the_list_html + "\n</ul>"
+    outfile.write("<ul>\n")
+    for i, topic_name in enumerate(sorted_topics(topic_data)):
+        topic_info = topic_info_string(topic_data[topic_name])
+        if i > 0:
+            outfile.write("\n")
+        outfile.write(
+            _TOPIC_ITEM_HTML.format_map(
+                dict(
+                    sanitized_topic_name=html.escape(sanitize(topic_name)),
+                    topic_name=html.escape(topic_name),
+                    topic_info=html.escape(topic_info),
+                )
+            )
+        )
+    outfile.write("\n</ul>")
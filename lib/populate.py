@@ -36,37 +36,59 @@ About the data:
 
     In each stream subdirectory, there is a json file for each topic in that stream.
 
-    This json file is a list of message objects,
-    as desribed at https://zulip.com/api/get-messages
+    This json file has one message object per line (newline-delimited
+    JSON), with messages as desribed at https://zulip.com/api/get-messages.
+    New messages are appended to the end of the file.
+
+    (Archives built by older versions stored each topic as a single
+    JSON list.  We can still read those, and convert them to the
+    one-message-per-line format the first time we append to them.)
 """
 
-import json
+import copy
+import os
+import threading
 import time
-from datetime import datetime
-from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import orjson
+
 from .common import (
     exit_immediately,
     open_outfile,
 )
+from .files import parse_topic_messages
 from .url import (
     sanitize_stream,
     sanitize,
 )
 
+# Number of streams fetched from Zulip concurrently.
+MAX_WORKERS = 8
+
 
+# orjson always writes UTF-8 (like json's ensure_ascii=False) and
+# returns bytes, so the files these are written to are opened in
+# binary mode.
 def dump_json(js, outfile):
-    json.dump(js, outfile, ensure_ascii=False, sort_keys=True, indent=4)
+    outfile.write(orjson.dumps(js, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+
+
+# Writes each item as one line of JSON (newline-delimited JSON).
+def dump_json_lines(items, outfile):
+    for item in items:
+        outfile.write(
+            orjson.dumps(item, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        )
 
 
 # Takes a list of messages. Returns a dict mapping topic names to lists of messages in that topic.
-def separate_results(list):
-    map = {}
-    for m in list:
-        if m["subject"] not in map:
-            map[m["subject"]] = [m]
-        else:
-            map[m["subject"]].append(m)
-    return map
+def separate_results(msgs):
+    topic_msgs = defaultdict(list)
+    for m in msgs:
+        topic_msgs[m["subject"]].append(m)
+    return topic_msgs
 
 
 # Retrieves all messages matching request from Zulip, starting at post id anchor.
@@ -81,13 +103,26 @@ def request_all(client, request, anchor=0):
     while not response["found_newest"]:
         request["anchor"] = response["messages"][-1]["id"] + 1
         response = safe_request(client.get_messages, request)
-        msgs = msgs + response["messages"]
+        msgs.extend(response["messages"])
     return msgs
 
 
+# Builds a get_messages request for every message in a stream.  request_all
+# fills in the anchor and page size, so this is built once per stream and
+# reused for every page.
+def stream_request(stream_name):
+    return {
+        "narrow": [{"operator": "stream", "operand": stream_name}],
+        "client_gravatar": True,
+        "apply_markdown": True,
+    }
+
+
 # runs client.cmd(args). If the response is a rate limit error, waits
 # the requested time and then retries the request.
 def safe_request(cmd, *args, **kwargs):
+    if _stop_fetching.is_set():
+        raise StreamJobCancelled()
     rsp = cmd(*args, **kwargs)
     while rsp["result"] == "error":
         if "retry-after" in rsp:
@@ -111,6 +146,80 @@ def get_streams(client):
     return response["streams"]
 
 
+class StreamJobCancelled(Exception):
+    pass
+
+
+# Set when a stream job fails, so the other running jobs stop fetching.
+_stop_fetching = threading.Event()
+
+
+# Streams are independent and fetching is bound on Zulip API latency, so we
+# fetch several at once; safe_request handles rate limiting.  Takes a list of
+# (stream_name, func, args), runs func(*args) for each on a thread pool, and
+# calls handle_result(stream_name, result) on this thread as each finishes.
+#
+# If a job fails (including via exit_immediately), we cancel the jobs that
+# haven't started, tell running jobs to stop at their next request to Zulip,
+# and re-raise the error once they're done.  Jobs that manage to finish
+# anyway still get handled, since their files are already written.
+def run_stream_jobs(jobs, handle_result):
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(func, *args): stream_name
+            for stream_name, func, args in jobs
+        }
+        unhandled = set(futures)
+        try:
+            for future in as_completed(futures):
+                unhandled.discard(future)
+                result = future.result()
+                print(futures[future])
+                handle_result(futures[future], result)
+        except BaseException:
+            _stop_fetching.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            _stop_fetching.clear()
+            for future in unhandled:
+                if not future.cancelled() and future.exception() is None:
+                    handle_result(futures[future], future.result())
+            raise
+
+
+# Retrieves all messages for one stream from Zulip and writes its topic files.
+# Returns the stream's entry for stream_index.json.
+def populate_stream(client, json_root, s):
+    stream_name = s["name"]
+    stream_id = s["stream_id"]
+
+    stream_dir = json_root / sanitize_stream(stream_name, stream_id)
+
+    # Messages carry their topic in `subject`, so one stream-wide
+    # fetch gets us everything we need without a request per topic.
+    messages = request_all(client, stream_request(stream_name))
+
+    latest_id = 0  # till we know better
+
+    topic_data = {}
+
+    for topic_name, topic_messages in separate_results(messages).items():
+        topic_count = len(topic_messages)
+        last_message = topic_messages[-1]
+        latest_date = last_message["timestamp"]
+
+        topic_data[topic_name] = dict(size=topic_count, latest_date=latest_date)
+
+        latest_id = max(latest_id, last_message["id"])
+
+        dump_topic_messages(stream_dir, sanitize(topic_name), topic_messages)
+
+    return dict(
+        id=stream_id,
+        latest_id=latest_id,
+        topic_data=topic_data,
+    )
+
+
 # Retrieves all messages from Zulip and builds a cache at json_root.
 def populate_all(
     client,
@@ -122,54 +231,49 @@ def populate_all(
 
     streams_data = {}
 
-    for s in streams:
-        stream_name = s["name"]
-        stream_id = s["stream_id"]
-
-        print(stream_name)
-
-        topics = safe_request(client.get_stream_topics, stream_id)["topics"]
-
-        latest_id = 0  # till we know better
-
-        topic_data = {}
-
-        for t in topics:
-            topic_name = t["name"]
-
-            request = {
-                "narrow": [
-                    {"operator": "stream", "operand": stream_name},
-                    {"operator": "topic", "operand": topic_name},
-                ],
-                "client_gravatar": True,
-                "apply_markdown": True,
-            }
-
-            messages = request_all(client, request)
-
-            topic_count = len(messages)
-            last_message = messages[-1]
-            latest_date = last_message["timestamp"]
-
-            topic_data[topic_name] = dict(size=topic_count, latest_date=latest_date)
-
-            latest_id = max(latest_id, last_message["id"])
-
-            dump_topic_messages(json_root, s, topic_name, messages)
-
-        stream_data = dict(
-            id=stream_id,
-            latest_id=latest_id,
-            topic_data=topic_data,
-        )
-
-        streams_data[stream_name] = stream_data
+    jobs = [(s["name"], populate_stream, (client, json_root, s)) for s in streams]
+    run_stream_jobs(jobs, streams_data.__setitem__)
 
     js = dict(streams=streams_data, time=time.time())
     dump_stream_index(json_root, js)
 
 
+# Retrieves new messages for one stream from Zulip and appends them to its
+# topic files.  Takes and returns the stream's entry for stream_index.json,
+# updating it in place, so callers running this on a thread should pass
+# in a copy.
+def update_stream(client, json_root, s, stream_data):
+    new_msgs = request_all(
+        client, stream_request(s["name"]), stream_data["latest_id"] + 1
+    )
+    stream_dir = json_root / sanitize_stream(s["name"], s["stream_id"])
+    topic_data = stream_data["topic_data"]
+    nm = separate_results(new_msgs)
+    for topic_name in nm:
+        sanitized_topic_name = sanitize(topic_name)
+        p = stream_dir / (sanitized_topic_name + ".json")
+        m = nm[topic_name]
+        if p.exists():
+            if topic_name in topic_data:
+                old_size = topic_data[topic_name]["size"]
+            else:
+                old_size = len(parse_topic_messages(p.read_bytes()))
+            append_topic_messages(p, m)
+        else:
+            old_size = 0
+            dump_topic_messages(stream_dir, sanitized_topic_name, m)
+        new_topic_data = {
+            "size": len(m) + old_size,
+            "latest_date": m[-1]["timestamp"],
+        }
+        topic_data[topic_name] = new_topic_data
+    # Only move latest_id forward once every topic file is written, so an
+    # index saved with this entry never skips messages we haven't stored.
+    if len(new_msgs) > 0:
+        stream_data["latest_id"] = new_msgs[-1]["id"]
+    return stream_data
+
+
 # Retrieves only new messages from Zulip, based on timestamps from the last update.
 # Raises an exception if there is no index at json_root/stream_index.json
 def populate_incremental(
@@ -178,7 +282,7 @@ def populate_incremental(
     is_valid_stream_name,
 ):
     streams = get_streams(client)
-    stream_index = json_root / Path("stream_index.json")
+    stream_index = json_root / "stream_index.json"
 
     if not stream_index.exists():
         error_msg = """
@@ -195,48 +299,27 @@ def populate_incremental(
         )
         exit_immediately(error_msg)
 
-    f = stream_index.open("r", encoding="utf-8")
-    js = json.load(f)
-    f.close()
+    js = orjson.loads(stream_index.read_bytes())
 
+    # Each worker gets its own copy of its stream's entry, so `js` only
+    # changes when we merge the results back in here as they complete.
+    jobs = []
     for s in (s for s in streams if is_valid_stream_name(s)):
-        print(s["name"])
-        if s["name"] not in js["streams"]:
-            js["streams"][s["name"]] = {
+        if s["name"] in js["streams"]:
+            stream_data = copy.deepcopy(js["streams"][s["name"]])
+        else:
+            stream_data = {
                 "id": s["stream_id"],
                 "latest_id": 0,
                 "topic_data": {},
             }
-        request = {
-            "narrow": [{"operator": "stream", "operand": s["name"]}],
-            "client_gravatar": True,
-            "apply_markdown": True,
-        }
-        new_msgs = request_all(
-            client, request, js["streams"][s["name"]]["latest_id"] + 1
-        )
-        if len(new_msgs) > 0:
-            js["streams"][s["name"]]["latest_id"] = new_msgs[-1]["id"]
-        nm = separate_results(new_msgs)
-        for topic_name in nm:
-            p = (
-                json_root
-                / Path(sanitize_stream(s["name"], s["stream_id"]))
-                / Path(sanitize(topic_name) + ".json")
-            )
-            topic_exists = p.exists()
-            old = []
-            if topic_exists:
-                f = p.open("r", encoding="utf-8")
-                old = json.load(f)
-                f.close()
-            m = nm[topic_name]
-            new_topic_data = {
-                "size": len(m) + len(old),
-                "latest_date": m[-1]["timestamp"],
-            }
-            js["streams"][s["name"]]["topic_data"][topic_name] = new_topic_data
-            dump_topic_messages(json_root, s, topic_name, old + m)
+        jobs.append((s["name"], update_stream, (client, json_root, s, stream_data)))
+
+    def merge_stream_data(stream_name, stream_data):
+        js["streams"][stream_name] = stream_data
+        dump_stream_index(json_root, js)
+
+    run_stream_jobs(jobs, merge_stream_data)
 
     js["time"] = time.time()
     dump_stream_index(json_root, js)
@@ -246,23 +329,46 @@ def dump_stream_index(json_root, js):
     if not ("streams" in js and "time" in js):
         raise Exception("programming error")
 
-    out = open_outfile(json_root, Path("stream_index.json"), "w")
+    # Write to a temporary file and rename it into place, so that a crash
+    # mid-write never leaves a truncated index behind.  We fsync before
+    # the rename so the new contents are on disk before they replace
+    # the old index.
+    out = open_outfile(json_root, "stream_index.json.tmp", "wb")
     dump_json(js, out)
+    out.flush()
+    os.fsync(out.fileno())
     out.close()
+    os.replace(json_root / "stream_index.json.tmp", json_root / "stream_index.json")
 
 
-def dump_topic_messages(json_root, stream_data, topic_name, message_data):
-    stream_name = stream_data["name"]
-    stream_id = stream_data["stream_id"]
-    sanitized_stream_name = sanitize_stream(stream_name, stream_id)
-    stream_dir = json_root / Path(sanitized_stream_name)
-
-    sanitized_topic_name = sanitize(topic_name)
+# stream_dir is the stream's subdirectory of json_root.  Callers pass in
+# the sanitized topic name, since they've already worked it out.
+def dump_topic_messages(stream_dir, sanitized_topic_name, message_data):
     topic_fn = sanitized_topic_name + ".json"
 
-    out = open_outfile(stream_dir, topic_fn, "w")
+    out = open_outfile(stream_dir, topic_fn, "wb")
     msgs = [slim_message(m) for m in message_data]
-    dump_json(msgs, out)
+    dump_json_lines(msgs, out)
+    out.close()
+
+
+# Appends messages to an existing topic file.  Since topic files have one
+# message per line, this never needs to read the old messages back in,
+# except to convert a file from the old single-list format the first time
+# we append to it.
+def append_topic_messages(topic_path, message_data):
+    msgs = [slim_message(m) for m in message_data]
+
+    with topic_path.open("rb") as f:
+        is_json_list = f.read(1) == b"["
+
+    if is_json_list:
+        old_msgs = parse_topic_messages(topic_path.read_bytes())
+        out = open_outfile(topic_path.parent, topic_path.name, "wb")
+        dump_json_lines(old_msgs + msgs, out)
+    else:
+        out = open_outfile(topic_path.parent, topic_path.name, "ab")
+        dump_json_lines(msgs, out)
     out.close()
 
 
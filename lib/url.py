@@ -21,7 +21,9 @@ And then URLs use Zulip stream/topics, which are sometimes
     sanitized_topic_name: lunch
 """
 
+import string
 import urllib.parse
+from functools import lru_cache
 
 
 def zulip_post_url(zulip_url, stream_id, stream_name, topic_name, post_id):
@@ -66,18 +68,37 @@ def archive_message_url(
 
 ## String cleaning functions
 
+# Bytes that urllib.parse.quote leaves alone, minus ".", which Zulip escapes.
+_SAFE_BYTES = (string.ascii_letters + string.digits + "_-~").encode("ascii")
 
+# What each UTF-8 byte turns into under sanitize().
+_SANITIZE_TABLE = [
+    chr(b) if b in _SAFE_BYTES else ".{:02X}".format(b) for b in range(256)
+]
+
+
+# The same stream and topic names get sanitized once per message when we
+# build the website, so we cache the results.
+@lru_cache(maxsize=None)
 def sanitize(s):
     """
     Sanitize the string to a safe string that can be used in URLs
 
-    This is copied from Zulip's core code:
+    This is equivalent to Zulip's core code:
     https://github.com/zulip/zulip/blob/de31114d700561f32139a63a0e5f33d5c30039b3/zerver/lib/url_encoding.py#L8
+
+        urllib.parse.quote(s, safe=b"").replace(".", "%2E").replace("%", ".")
+
+    but does the escaping in one pass over a precomputed table.
     """
-    return urllib.parse.quote(s, safe=b"").replace(".", "%2E").replace("%", ".")
+    b = s.encode("utf-8")
+    if not b.translate(None, _SAFE_BYTES):
+        return s
+    return "".join([_SANITIZE_TABLE[c] for c in b])
 
 
 # create a unique sanitized identifier for a stream
+@lru_cache(maxsize=None)
 def sanitize_stream(stream_name, stream_id):
     """
     Encode streams for urls as something like 99-Foo-bar.
@@ -35,8 +35,8 @@ from .html import (
     format_message_html,
     last_updated_footer_html,
     topic_page_links_html,
-    stream_list_page_html,
-    topic_list_page_html,
+    write_stream_list_page_html,
+    write_topic_list_page_html,
 )
 
 from .url import (
@@ -142,10 +142,8 @@ def write_main_page(
     """
     outfile = open_main_page(md_root)
 
-    content_html = stream_list_page_html(streams)
-
     outfile.write(page_head_html)
-    outfile.write(content_html)
+    write_stream_list_page_html(outfile, streams)
     outfile.write(date_footer_html)
     outfile.write(page_footer_html)
     outfile.close()
@@ -179,10 +177,8 @@ def write_stream_topics(
 
     topic_data = stream["topic_data"]
 
-    content_html = topic_list_page_html(stream_name, stream_url, topic_data)
-
     outfile.write(page_head_html)
-    outfile.write(content_html)
+    write_topic_list_page_html(outfile, stream_name, stream_url, topic_data)
     outfile.write(date_footer_html)
     outfile.write(page_footer_html)
     outfile.close()
@@ -263,6 +259,8 @@ def write_topic_messages(
             stream_id,
             topic_name,
             msg,
+            sanitized_stream_name=sanitized_stream_name,
+            sanitized_topic_name=sanitized_topic_name,
         )
         outfile.write(msg_html)
         outfile.write("\n\n")
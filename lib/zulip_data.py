@@ -8,9 +8,24 @@ for folks who may want to emit differently structured
 HTML or markdown.
 """
 
+import msgspec
+
 from .date_helper import format_date1
 
 
+class Message(msgspec.Struct):
+    """
+    A message as we store it in a topic file (see slim_message
+    in populate.py).  The fields are a subset of the message
+    objects described at https://zulip.com/api/get-messages.
+    """
+
+    id: int
+    sender_full_name: str
+    timestamp: int
+    content: str
+
+
 def sorted_streams(streams):
     """
     Streams are sorted so that streams with the most topics
@@ -2,10 +2,19 @@
 import sys
 
 sys.path.append("lib")
+# populate.py and files.py use relative imports, so they need the repo
+# root on the path to be imported as part of the lib package.
+sys.path.append(".")
+
+import json
+import tempfile
+from pathlib import Path
 
 import common
 import url
 
+from lib import files, populate
+
 
 class Settings:
     def __init__(self, **kwargs):
@@ -43,6 +52,9 @@ def test_sanitize():
         url.sanitize('"the mighty turtle 🐢"'),
         ".22the.20mighty.20turtle.20.F0.9F.90.A2.22",
     )
+    assert_equal(url.sanitize("turtles"), "turtles")
+    assert_equal(url.sanitize("v1.2_beta~rc-1"), "v1.2E2_beta~rc-1")
+    assert_equal(url.sanitize("café"), "caf.C3.A9")
 
 
 def test_validator():
@@ -91,6 +103,67 @@ def test_validator():
     assert_equal(validator(stream("bar", False, False)), False)
 
 
+def message(msg_id, content):
+    # Returns a minimalist Zulip message dictionary.
+    return {
+        "content": content,
+        "id": msg_id,
+        "sender_full_name": "Alice",
+        "subject": "lunch",
+        "timestamp": 1600000000 + msg_id,
+    }
+
+
+def slim(msg):
+    return {k: v for k, v in msg.items() if k != "subject"}
+
+
+def test_topic_messages_round_trip():
+    old_msgs = [message(1, "pizza?"), message(2, "tacos 🌮")]
+    new_msgs = [message(3, "fine, tacos")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stream_dir = Path(tmp)
+        populate.dump_topic_messages(stream_dir, "lunch", old_msgs)
+        populate.append_topic_messages(stream_dir / "lunch.json", new_msgs)
+
+        data = (stream_dir / "lunch.json").read_bytes()
+        assert_equal(data.count(b"\n"), 3)
+        assert_equal(
+            files.parse_topic_messages(data),
+            [slim(m) for m in old_msgs + new_msgs],
+        )
+
+
+def test_topic_messages_from_json_list():
+    # Older archives stored each topic as one indented JSON list.
+    old_msgs = [slim(message(1, "pizza?")), slim(message(2, "tacos 🌮"))]
+    new_msgs = [message(3, "fine, tacos")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stream_dir = Path(tmp)
+        (stream_dir / "lunch.json").write_text(
+            json.dumps(old_msgs, ensure_ascii=False, sort_keys=True, indent=4),
+            encoding="utf-8",
+        )
+        assert_equal(
+            files.parse_topic_messages((stream_dir / "lunch.json").read_bytes()),
+            old_msgs,
+        )
+
+        populate.append_topic_messages(stream_dir / "lunch.json", new_msgs)
+
+        # The first append converts the file to one message per line.
+        data = (stream_dir / "lunch.json").read_bytes()
+        assert_equal(data.count(b"\n"), 3)
+        assert_equal(
+            files.parse_topic_messages(data),
+            old_msgs + [slim(m) for m in new_msgs],
+        )
+
+
 if __name__ == "__main__":
     test_sanitize()
     test_validator()
+    test_topic_messages_round_trip()
+    test_topic_messages_from_json_list()